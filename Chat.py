@@ -1,8 +1,8 @@
 import os
+import pandas as pd
 import streamlit as st
 from modules.ui_css import inject
-from modules.config_manager import load_config, save_config
-from modules import sql_engine
+from modules.app_cache import cached_config, cached_engine, get_cached_turn, set_cached_turn, TURN_CACHE_MAX_ROWS
 from modules.ai_agent import synthesize_sql, answer_with_data, pick_most_related
 
 st.set_page_config(page_title="SQL Chat", page_icon="💬", layout="wide")
@@ -13,20 +13,17 @@ st.caption("LangChain-powered demo. Data from a local CSV/Excel simulated as a S
 
 # Load config
 if "app_config" not in st.session_state:
-    st.session_state.app_config = load_config()
+    st.session_state.app_config = cached_config()
 cfg = st.session_state.app_config
 
-# Build or rebuild engine if needed
-if "engine" not in st.session_state or st.session_state.get("engine_src") != (cfg.data.file_path, cfg.data.table_name):
-    try:
-        eng = sql_engine.build_engine_from_file(cfg.data.file_path, cfg.data.table_name)
-        st.session_state.engine = eng
-        st.session_state.engine_src = (cfg.data.file_path, cfg.data.table_name)
-    except Exception as e:
-        st.error(f"Failed to load data: {e}")
-        st.stop()
-
-engine = st.session_state.engine
+# Build engine (cached across reruns/sessions; rebuilt when the file changes)
+try:
+    engine = cached_engine(cfg.data.file_path, cfg.data.table_name)
+except Exception as e:
+    st.error(f"Failed to load data: {e}")
+    st.stop()
+st.session_state.engine = engine
+st.session_state.engine_src = (cfg.data.file_path, cfg.data.table_name)
 
 # sidebar status & controls
 with st.sidebar:
@@ -55,54 +52,33 @@ if user_input:
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    # Agent: pick most-related SQL from snippets
-    candidate_sql = pick_most_related(user_input, [{"name": s.name, "sql": s.sql} for s in cfg.snippets])
-
-    # Compose inputs for SQL synthesis
-    schema = engine.schema_text()
-    details = cfg.data.additional_details
-
-    # Call AI (or offline) to synthesize SQL
-    sql_query = synthesize_sql(
-        cfg={
-            "ai": {
-                "provider": cfg.ai.provider,
-                "model": cfg.ai.model,
-                "temperature": cfg.ai.temperature,
-                "offline_demo_mode": cfg.ai.offline_demo_mode,
-                "system_prompt": cfg.ai.system_prompt,
-                "sql_synth_prompt": cfg.ai.sql_synth_prompt,
-            }
-        },
-        user_query=user_input,
-        schema=schema,
-        details=details,
-        candidate_sql=candidate_sql,
-        table_name=cfg.data.table_name,
+    # Whole-turn cache: same question, data file version and settings -> same result
+    turn_key = (
+        user_input,
+        os.stat(cfg.data.file_path).st_mtime_ns,
+        cfg.data.table_name,
+        repr(cfg.ai),
+        cfg.data.additional_details,
+        tuple((s.name, s.sql) for s in cfg.snippets),
+        bool(os.getenv("OPENAI_API_KEY")),
     )
-
-    # Run SQL
-    try:
-        cols, rows = engine.execute_safe_select(sql_query)
-    except Exception as e:
-        cols, rows = [], []
-        error_text = f"SQL failed: {e}"
-    else:
+    cached_turn = get_cached_turn(turn_key)
+    if cached_turn is not None:
+        sql_query, cols, rows, answer = cached_turn
         error_text = None
-
-    # Show assistant message
-    with st.chat_message("assistant"):
-        st.markdown("**SQL used:**")
-        st.code(sql_query, language="sql")
-        if error_text:
-            st.error(error_text)
+    else:
+        # Compose inputs for SQL synthesis. Without an LLM (offline mode, or no API key)
+        # synthesize_sql falls back to rules that ignore the snippet hint, so skip ranking
+        schema = engine.schema_text()
+        if cfg.ai.offline_demo_mode or not os.getenv("OPENAI_API_KEY") or not cfg.snippets:
+            candidate_sql = ""
         else:
-            st.markdown("**Data preview:**")
-            st.dataframe(rows, use_container_width=True, hide_index=True)
+            candidate_sql = pick_most_related(user_input, [{"name": s.name, "sql": s.sql, "tokens": s.tokens} for s in cfg.snippets])
+        details = cfg.data.additional_details
 
-        # Ask LLM (or fallback) to narrate
-        try:
-            answer = answer_with_data(
+        # Call AI (or offline) to synthesize SQL; the full query is needed before running it
+        with st.spinner("Generating SQL…"):
+            sql_query = synthesize_sql(
                 cfg={
                     "ai": {
                         "provider": cfg.ai.provider,
@@ -114,12 +90,59 @@ if user_input:
                     }
                 },
                 user_query=user_input,
-                sql=sql_query,
-                columns=cols,
-                rows=rows,
+                schema=schema,
+                details=details,
+                candidate_sql=candidate_sql,
+                table_name=cfg.data.table_name,
             )
+
+        # Run SQL
+        try:
+            cols, rows = engine.execute_safe_select(sql_query)
         except Exception as e:
-            answer = f"(Answer generator failed: {e})"
-        st.markdown(answer)
+            cols, rows = [], []
+            error_text = f"SQL failed: {e}"
+        else:
+            error_text = None
+
+    # Show assistant message
+    with st.chat_message("assistant"):
+        st.markdown("**SQL used:**")
+        st.code(sql_query, language="sql")
+        if error_text:
+            st.error(error_text)
+        else:
+            st.markdown("**Data preview:**")
+            # tuples + column names straight into a frame; no per-row dicts
+            # (pandas is always present here: streamlit depends on it)
+            st.dataframe(pd.DataFrame(rows, columns=cols), use_container_width=True, hide_index=True)
+
+        # Ask LLM (or fallback) to narrate; st.write_stream renders chunks as they arrive
+        if cached_turn is not None:
+            st.markdown(answer)
+        else:
+            try:
+                answer = st.write_stream(answer_with_data(
+                    cfg={
+                        "ai": {
+                            "provider": cfg.ai.provider,
+                            "model": cfg.ai.model,
+                            "temperature": cfg.ai.temperature,
+                            "offline_demo_mode": cfg.ai.offline_demo_mode,
+                            "system_prompt": cfg.ai.system_prompt,
+                            "sql_synth_prompt": cfg.ai.sql_synth_prompt,
+                        }
+                    },
+                    user_query=user_input,
+                    sql=sql_query,
+                    columns=cols,
+                    rows=rows,
+                ))
+            except Exception as e:
+                answer = f"(Answer generator failed: {e})"
+                st.markdown(answer)
+            else:
+                if not error_text and len(rows) <= TURN_CACHE_MAX_ROWS:
+                    set_cached_turn(turn_key, (sql_query, cols, rows, answer))
 
     st.session_state.messages.append({"role": "assistant", "content": answer})
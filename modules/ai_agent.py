@@ -1,33 +1,106 @@
+import csv
+import io
 import os
 import re
-from typing import Dict, Any, List, Tuple
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from modules.text_tokens import tokenize
+
+# body of the first ``` fence (optional sql/sqlite tag) in an LLM reply; unclosed fences run to the end
+_SQL_FENCE_RE = re.compile(r"```(?:sql(?:ite)?\b)?\s*(.*?)(?:```|\Z)", re.IGNORECASE | re.DOTALL)
+_TOP_RE = re.compile(r"top\s+(\d+)")
+_ITEM_EQ_RE = re.compile(r'\bitem\b\s*(?:=|is)\s*([A-Za-z0-9_ -]+)')
+_CUSTOMER_FILTER_RE = re.compile(r'customer\s+(?:=|is|named)\s*([A-Za-z0-9_ -]+)')
+_ITEM_FILTER_RE = re.compile(r'item\s+(?:=|is|named)\s*([A-Za-z0-9_ -]+)')
+
+# offline_sql intent -> SQL template
+_OFFLINE_SQL = {
+    "count": "SELECT COUNT(*) AS count FROM {table};",
+    "count_item": 'SELECT COUNT(*) AS count FROM {table} WHERE item = "{item}";',
+    "revenue": "SELECT SUM(quantity*price) AS revenue FROM {table};",
+    "revenue_by_item": "SELECT item, SUM(quantity*price) AS revenue FROM {table} GROUP BY item ORDER BY revenue DESC LIMIT 10;",
+    "revenue_by_date": "SELECT date, SUM(quantity*price) AS revenue FROM {table} GROUP BY date ORDER BY date;",
+    "top_items": "SELECT item, SUM(quantity*price) AS revenue FROM {table} GROUP BY item ORDER BY revenue DESC LIMIT {k};",
+    "customer_rows": 'SELECT * FROM {table} WHERE customer = "{customer}" LIMIT 50;',
+    "item_rows": 'SELECT * FROM {table} WHERE item = "{item}" LIMIT 50;',
+    "default": "SELECT * FROM {table} LIMIT 20;",
+}
+
+# Prompt budget for answer_with_data: input tokens drive latency and cost
+ANSWER_MAX_ROWS = 10
+ANSWER_MAX_SQL_CHARS = 600
+ANSWER_MAX_TOKENS = 200
+
+# below this Jaccard score a snippet is not passed to the model as a hint
+MIN_SNIPPET_SIMILARITY = 0.05
+
+LLM_CACHE_PATH = ".langchain_cache.db"
+_llm_cache_installed = False
+
+def _install_llm_cache():
+    """Install a process-global SQLite cache so repeated prompts skip the API round-trip.
+
+    Only invoke() consults it, i.e. synthesize_sql. answer_with_data streams, and
+    BaseChatModel.stream bypasses the global LLM cache; repeated questions get their
+    answer replayed by the whole-turn cache in app_cache instead.
+    """
+    global _llm_cache_installed
+    if _llm_cache_installed:
+        return
+    _llm_cache_installed = True
+    try:
+        from langchain_core.globals import set_llm_cache
+        from langchain_community.cache import SQLiteCache
+        set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+    except Exception:
+        # cache is an optimization only; run uncached if langchain-community is missing
+        pass
+
+_install_llm_cache()
+
 # We import conditionally to keep offline mode light.
-def _maybe_llm(model: str, temperature: float = 0.0):
+@lru_cache(maxsize=8)
+def _get_llm(model: str, temperature: float, api_key: str, max_tokens: Optional[int] = None):
+    """Build one client per (model, temperature, key, max_tokens) so its HTTP connection pool is reused."""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model, temperature=temperature, api_key=api_key, max_tokens=max_tokens)
+
+def _maybe_llm(model: str, temperature: float = 0.0, max_tokens: Optional[int] = None):
+    key = os.getenv("OPENAI_API_KEY", "")
+    if not key:
+        return None
     try:
-        from langchain_openai import ChatOpenAI
-        key = os.getenv("OPENAI_API_KEY", "")
-        if not key:
-            return None
-        return ChatOpenAI(model=model, temperature=temperature)
+        return _get_llm(model, float(temperature), key, max_tokens)
     except Exception:
         return None
 
-def naive_similarity(a: str, b: str) -> float:
-    at = set(re.findall(r"[a-zA-Z0-9]+", a.lower()))
-    bt = set(re.findall(r"[a-zA-Z0-9]+", b.lower()))
-    if not at or not bt: 
+def _jaccard(at: frozenset, bt: frozenset) -> float:
+    if not at or not bt:
         return 0.0
     return len(at & bt) / len(at | bt)
 
-def pick_most_related(user_query: str, snippets: List[Dict[str, str]]) -> str:
-    if not snippets:
+def naive_similarity(a: str, b: str) -> float:
+    return _jaccard(tokenize(a), tokenize(b))
+
+def pick_most_related(user_query: str, snippets: List[Dict[str, Any]]) -> str:
+    """Return the snippet SQL closest to the query, or "" when nothing is a useful hint.
+
+    Snippets may carry precomputed "tokens" (see config_manager.Snippet); otherwise
+    their SQL is tokenized here.
+    """
+    if not snippets or not user_query.strip():
         return ""
-    best = max(snippets, key=lambda s: naive_similarity(user_query, s.get("sql","")))
-    return best.get("sql", "")
+    # tokenize the query once; snippet token sets are precomputed or lru-cached
+    q = tokenize(user_query)
+    if not q:
+        return ""
+    scores = [_jaccard(q, s.get("tokens") or tokenize(s.get("sql", ""))) for s in snippets]
+    best = max(range(len(snippets)), key=scores.__getitem__)
+    return snippets[best].get("sql", "") if scores[best] >= MIN_SNIPPET_SIMILARITY else ""
 
 def synthesize_sql(cfg: Dict[str, Any], user_query: str, schema: str, details: str, candidate_sql: str, table_name: str) -> str:
     """Return a SQL string. Uses LLM if configured; else offline rules."""
@@ -55,61 +128,54 @@ def synthesize_sql(cfg: Dict[str, Any], user_query: str, schema: str, details: s
         "candidate_sql": candidate_sql or "(none)",
         "table_name": table_name,
     })
-    # sanitize: keep first semicolon, remove code fences
-    sql = sql.strip().strip("`")
-    if "```" in sql:
-        sql = sql.split("```")[-2] if len(sql.split("```"))>=2 else sql
-    # Ensure it's a single statement
-    sql = sql.split(";")[0].strip() + ";"
-    return sql
+    # sanitize: take the fenced body if any (drops preamble + sql tag), strip outer backticks,
+    # keep the first statement; backtick-quoted identifiers inside it are left alone
+    m = _SQL_FENCE_RE.search(sql)
+    sql = (m.group(1) if m else sql).strip().strip("`")
+    return sql.split(";")[0].strip() + ";"
+
+def _clean_value(m: "re.Match") -> str:
+    return m.group(1).strip().strip('"\'')
 
 def offline_sql(user_query: str, table_name: str) -> str:
     """Very small rule-based translator for demo when no API key."""
     q = user_query.lower()
+    toks = tokenize(q)
+    # keyword intents test the token set; each parameter pattern is searched on its own,
+    # and only by the branch that needs it
+    params: Dict[str, Any] = {}
 
-    # Count rows
-    if "how many" in q or "count" in q:
-        # optional column filter by equality if pattern like 'where item is X'
-        m = re.search(r'\bitem\b\s*(?:=|is)\s*([A-Za-z0-9_ -]+)', q)
+    if "count" in toks or "how many" in q:
+        m = _ITEM_EQ_RE.search(q)
         if m:
-            val = m.group(1).strip().strip('"\'')
-            return f'SELECT COUNT(*) AS count FROM {table_name} WHERE item = "{val}";'
-        return f"SELECT COUNT(*) AS count FROM {table_name};"
-
-    # Sum revenue
-    if "revenue" in q or "total sales" in q or "sum" in q:
+            intent, params["item"] = "count_item", _clean_value(m)
+        else:
+            intent = "count"
+    elif toks & {"revenue", "sum"} or "total sales" in q:
         if "by item" in q or "per item" in q:
-            return f'SELECT item, SUM(quantity*price) AS revenue FROM {table_name} GROUP BY item ORDER BY revenue DESC LIMIT 10;'
-        if "by date" in q or "per day" in q or "daily" in q:
-            return f'SELECT date, SUM(quantity*price) AS revenue FROM {table_name} GROUP BY date ORDER BY date;'
-        return f"SELECT SUM(quantity*price) AS revenue FROM {table_name};"
-
-    # Top-k items
-    mtop = re.search(r"top\s+(\d+)", q)
-    if mtop and ("item" in q or "product" in q):
-        k = int(mtop.group(1))
-        return f'SELECT item, SUM(quantity*price) AS revenue FROM {table_name} GROUP BY item ORDER BY revenue DESC LIMIT {k};'
-
-    # Filter by customer or item if present
-    m_cust = re.search(r'customer\s+(?:=|is|named)\s*([A-Za-z0-9_ -]+)', q)
-    if m_cust:
-        val = m_cust.group(1).strip().strip('"\'')
-        return f'SELECT * FROM {table_name} WHERE customer = "{val}" LIMIT 50;'
-    m_item = re.search(r'item\s+(?:=|is|named)\s*([A-Za-z0-9_ -]+)', q)
-    if m_item:
-        val = m_item.group(1).strip().strip('"\'')
-        return f'SELECT * FROM {table_name} WHERE item = "{val}" LIMIT 50;'
-
-    # default
-    return f"SELECT * FROM {table_name} LIMIT 20;"
-
-def answer_with_data(cfg: Dict[str, Any], user_query: str, sql: str, columns: List[str], rows: List[dict]) -> str:
-    """Use LLM to craft a concise answer from rows; fallback to a textual summary."""
+            intent = "revenue_by_item"
+        elif "by date" in q or "per day" in q or "daily" in toks:
+            intent = "revenue_by_date"
+        else:
+            intent = "revenue"
+    else:
+        intent = "default"
+        mtop = _TOP_RE.search(q) if toks & {"item", "items", "product", "products"} else None
+        if mtop:
+            intent, params["k"] = "top_items", int(mtop.group(1))
+        elif (m := _CUSTOMER_FILTER_RE.search(q)):
+            intent, params["customer"] = "customer_rows", _clean_value(m)
+        elif (m := _ITEM_FILTER_RE.search(q)):
+            intent, params["item"] = "item_rows", _clean_value(m)
+    return _OFFLINE_SQL[intent].format(table=table_name, **params)
+
+def answer_with_data(cfg: Dict[str, Any], user_query: str, sql: str, columns: List[str], rows: List[tuple]) -> Iterator[str]:
+    """Stream a concise answer from rows; fallback to a textual summary (single chunk)."""
     if cfg["ai"]["offline_demo_mode"]:
-        return offline_answer(user_query, sql, columns, rows)
-    llm = _maybe_llm(cfg["ai"]["model"], cfg["ai"]["temperature"])
+        return iter([offline_answer(user_query, sql, columns, rows)])
+    llm = _maybe_llm(cfg["ai"]["model"], cfg["ai"]["temperature"], max_tokens=ANSWER_MAX_TOKENS)
     if llm is None:
-        return offline_answer(user_query, sql, columns, rows)
+        return iter([offline_answer(user_query, sql, columns, rows)])
 
     system = cfg["ai"]["system_prompt"]
     prompt = ChatPromptTemplate.from_messages([
@@ -117,25 +183,31 @@ def answer_with_data(cfg: Dict[str, Any], user_query: str, sql: str, columns: Li
         ("human",
          "User question: {user_query}\n\n"
          "SQL used: {sql}\n\n"
-         "Columns: {columns}\n\n"
-         "Rows (JSON-like):\n{rows}\n\n"
-         "Answer succinctly and include a 1-line takeaway.")
+         "Rows (CSV, first {n_shown} of {n_total}):\n{rows_text}\n\n"
+         "Reply in ≤40 words with a 1-line takeaway.")
     ])
     chain = prompt | llm | StrOutputParser()
-    # Limit rows rendered into prompt to avoid context blow-up
-    head = rows[:50]
-    return chain.invoke({
+    # Keep the prompt small: a few rows as compact CSV (header once, no per-row keys)
+    head = rows[:ANSWER_MAX_ROWS]
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+    writer.writerows(head)
+    # stream() yields text chunks as they arrive so the UI can render the first token early
+    # (it does not read or write the global LLM cache; see _install_llm_cache)
+    return chain.stream({
         "user_query": user_query,
-        "sql": sql,
-        "columns": columns,
-        "rows": head,
+        "sql": sql if len(sql) <= ANSWER_MAX_SQL_CHARS else "(omitted; too long)",
+        "n_shown": len(head),
+        "n_total": len(rows),
+        "rows_text": buf.getvalue(),
     })
 
-def offline_answer(user_query: str, sql: str, columns: List[str], rows: List[dict]) -> str:
+def offline_answer(user_query: str, sql: str, columns: List[str], rows: List[tuple]) -> str:
     n = len(rows)
     if n == 0:
         return "I ran your query but found no matching rows."
-    preview = rows[:5]
+    preview = [dict(zip(columns, r)) for r in rows[:5]]
     # tiny summary heuristics
     if any("revenue" in c.lower() for c in columns) and n <= 10:
         # maybe report top 3
@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import streamlit as st
+
+from modules import sql_engine
+from modules.config_manager import CONFIG_PATH, AppConfig, load_config
+
+# Streamlit-level caches shared by all pages and sessions. Keys include the file
+# mtime so edits on disk (or save_config) invalidate the cached entry.
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_config(path: str, mtime_ns: int) -> AppConfig:
+    return load_config()
+
+def cached_config() -> AppConfig:
+    """Parsed config.yaml; cache_data hands every caller its own copy, so edits stay local."""
+    if not os.path.exists(CONFIG_PATH):
+        return load_config()  # writes defaults
+    return _load_config(CONFIG_PATH, os.stat(CONFIG_PATH).st_mtime_ns)
+
+@st.cache_resource(show_spinner="Loading data…", max_entries=4)
+def _build_engine(path: str, mtime_ns: int, table_name: str) -> sql_engine.SimpleSQLite:
+    return sql_engine.build_engine_from_file(path, table_name)
+
+def cached_engine(path: str, table_name: str) -> sql_engine.SimpleSQLite:
+    """Engine for (path, mtime, table): a fresh in-memory build, or usually a read-only
+    connection to its on-disk snapshot; cache_resource shares the live connection."""
+    return _build_engine(path, os.stat(path).st_mtime_ns, table_name)
+
+def rebuild_engine(path: str, table_name: str) -> sql_engine.SimpleSQLite:
+    """Force a reload from the data file: drop cached engines and rewrite the snapshot."""
+    _build_engine.clear()
+    sql_engine.build_engine_from_file(path, table_name, force=True)
+    return cached_engine(path, table_name)
+
+TURN_CACHE_TTL = 3600  # seconds
+TURN_CACHE_MAX = 256
+TURN_CACHE_MAX_ROWS = 1000  # larger results are not cached: entries would pin table-sized copies
+
+@st.cache_resource
+def _turn_cache() -> "OrderedDict[tuple, Tuple[float, tuple]]":
+    return OrderedDict()
+
+_turn_lock = threading.Lock()
+
+def get_cached_turn(key: tuple) -> Optional[tuple]:
+    """(sql, cols, rows, answer) from an earlier identical chat turn, or None."""
+    cache = _turn_cache()
+    with _turn_lock:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.time() - stored_at > TURN_CACHE_TTL:
+            del cache[key]
+            return None
+        cache.move_to_end(key)
+        return value
+
+def set_cached_turn(key: tuple, value: tuple):
+    cache = _turn_cache()
+    with _turn_lock:
+        cache[key] = (time.time(), value)
+        cache.move_to_end(key)
+        while len(cache) > TURN_CACHE_MAX:
+            cache.popitem(last=False)
@@ -1,14 +1,26 @@
 import os
 import yaml
 from dataclasses import dataclass, field
-from typing import List, Dict, Any
+from typing import FrozenSet, List, Dict, Any
+
+from modules.text_tokens import tokenize
 
 CONFIG_PATH = os.path.join("config", "config.yaml")
 
+try:
+    from yaml import CSafeDumper as _Dumper  # libyaml-backed, much faster when available
+except ImportError:
+    from yaml import SafeDumper as _Dumper
+
 @dataclass
 class Snippet:
     name: str
     sql: str
+    # lowercase word tokens of sql, computed once so similarity ranking skips the regex per turn
+    tokens: FrozenSet[str] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.tokens = tokenize(self.sql)
 
 @dataclass
 class AIConfig:
@@ -61,4 +73,4 @@ def save_config(cfg: AppConfig):
     }
     os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
     with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        yaml.safe_dump(raw, f, sort_keys=False, allow_unicode=True)
+        yaml.dump(raw, f, Dumper=_Dumper, sort_keys=False, allow_unicode=True)
@@ -1,20 +1,45 @@
 import csv
+import glob
+import hashlib
 import os
 import re
 import sqlite3
+import tempfile
 import threading
 from typing import List, Dict, Any, Tuple, Optional
 
+try:
+    import pandas as pd  # optional fast path for .csv
+except Exception:
+    pd = None
+
 try:
     import openpyxl  # optional for .xlsx
 except Exception:
     openpyxl = None
 
+SNAPSHOT_VERSION = 3  # bump when the loaders change how tables are built
+TYPE_SAMPLE_ROWS = 1000  # rows scanned per load to find a non-empty value per column
+INDEXED_COLUMNS = ("item", "customer", "date")  # columns offline_sql filters/groups on
+
+_INT_RE = re.compile(r"[+-]?\d+")
+_FLOAT_RE = re.compile(r"[+-]?(\d*\.\d+|\d+\.\d*)([eE][+-]?\d+)?")
+_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
 class SimpleSQLite:
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, snapshot_path: Optional[str] = None):
         self.table_name = table_name
-        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
         self.lock = threading.Lock()
+        self._schema_text_cache: Dict[int, str] = {}  # sample_rows -> text; cleared on load
+        if snapshot_path:
+            # reuse a snapshot written by an earlier build; read-only so it is never mutated
+            self.conn = sqlite3.connect(f"file:{snapshot_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+            # throwaway in-memory DB: no durability needed, keep journals/temp data in RAM
+            self.conn.execute("PRAGMA journal_mode=MEMORY")
+            self.conn.execute("PRAGMA synchronous=OFF")
+            self.conn.execute("PRAGMA temp_store=MEMORY")
         self.conn.row_factory = sqlite3.Row
 
     def _infer_type(self, s: str) -> str:
@@ -22,49 +47,102 @@ class SimpleSQLite:
             return "TEXT"
         s = str(s)
         # int?
-        if re.fullmatch(r"[+-]?\d+", s):
+        if _INT_RE.fullmatch(s):
             return "INTEGER"
         # float?
-        if re.fullmatch(r"[+-]?(\d*\.\d+|\d+\.\d*)([eE][+-]?\d+)?", s):
+        if _FLOAT_RE.fullmatch(s):
             return "REAL"
         # iso date?
-        if re.fullmatch(r"\d{4}-\d{2}-\d{2}", s):
+        if _DATE_RE.fullmatch(s):
             return "TEXT"
         return "TEXT"
 
     def load_rows(self, rows: List[Dict[str, Any]]):
         if not rows:
             raise ValueError("No rows to load")
-        # infer types from first non-empty row
+        # infer types from each column's first non-empty value, scanning one sample window
         cols = list(rows[0].keys())
-        types = []
-        for c in cols:
-            v = next((r.get(c) for r in rows if r.get(c) not in (None, "")), None)
-            types.append(self._infer_type(v) if v is not None else "TEXT")
+        first_vals: Dict[str, Any] = {}
+        for r in rows[:TYPE_SAMPLE_ROWS]:
+            for c in cols:
+                if c not in first_vals and r.get(c) not in (None, ""):
+                    first_vals[c] = r.get(c)
+            if len(first_vals) == len(cols):
+                break
+        types = [self._infer_type(first_vals[c]) if c in first_vals else "TEXT" for c in cols]
 
         col_defs = ", ".join(f'"{c}" {t}' for c, t in zip(cols, types))
+        quoted_cols = ", ".join(f'"{c}"' for c in cols)
+        placeholders = ", ".join("?" for _ in cols)
+        insert_sql = f'INSERT INTO "{self.table_name}" ({quoted_cols}) VALUES ({placeholders})'
+        values_iter = ([r.get(c) for c in cols] for r in rows)
         with self.lock:
+            self._schema_text_cache.clear()
             self.conn.execute(f'DROP TABLE IF EXISTS "{self.table_name}"')
             self.conn.execute(f'CREATE TABLE "{self.table_name}" ({col_defs})')
+            # one transaction + executemany: a single C-level loop instead of a Python one
+            with self.conn:
+                self.conn.execute("BEGIN")
+                self.conn.executemany(insert_sql, values_iter)
+            self._create_indexes(cols)
 
-            placeholders = ", ".join("?" for _ in cols)
-            insert_sql = f'INSERT INTO "{self.table_name}" ({", ".join([f'"{c}"' for c in cols])}) VALUES ({placeholders})'
-            for r in rows:
-                values = [r.get(c, None) for c in cols]
-                self.conn.execute(insert_sql, values)
+    def load_dataframe(self, df: "pd.DataFrame", chunksize: int = 10_000):
+        if df.empty:
+            raise ValueError("No rows to load")
+        # all-blank columns carry no type information; declare them TEXT like the legacy loader
+        blank = df.columns[df.isna().all()]
+        if len(blank):
+            df = df.astype({c: "string" for c in blank})
+        # pandas maps dtypes to SQLite types and bulk-inserts via executemany
+        with self.lock:
+            self._schema_text_cache.clear()
+            df.to_sql(self.table_name, self.conn, if_exists="replace", index=False, chunksize=chunksize)
             self.conn.commit()
+            self._create_indexes(list(df.columns))
+
+    def _create_indexes(self, cols: List[str]):
+        # caller holds self.lock; paid once per load, then filters/GROUP BYs probe a B-tree
+        for c in INDEXED_COLUMNS:
+            if c in cols:
+                self.conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{self.table_name}_{c}" ON "{self.table_name}"("{c}")')
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
 
-    def execute_safe_select(self, sql: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    def save_snapshot(self, snapshot_path: str):
+        """Copy the database to snapshot_path atomically via SQLite's backup API."""
+        # mkstemp: unpredictable name, created exclusively with 0600 permissions
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(snapshot_path))
+        os.close(fd)
+        try:
+            dst = sqlite3.connect(tmp_path)
+            try:
+                with self.lock:
+                    self.conn.backup(dst)
+            finally:
+                dst.close()
+            os.replace(tmp_path, snapshot_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def execute_safe_select(self, sql: str) -> Tuple[List[str], List[tuple]]:
         s = sql.strip().lower()
         if not (s.startswith("select") or s.startswith("with")):
             raise ValueError("Only SELECT/WITH queries are allowed in demo mode.")
         with self.lock:
-            cur = self.conn.execute(sql)
+            # tuple cursor: skips sqlite3.Row wrapping; callers zip with col_names where dicts are needed
+            cur = self.conn.cursor()
+            cur.row_factory = None
+            cur.execute(sql)
             col_names = [d[0] for d in cur.description]
-            data = [dict(row) for row in cur.fetchall()]
+            data = cur.fetchall()
         return col_names, data
 
     def schema_text(self, sample_rows: int = 3) -> str:
+        # schema is fixed between loads, so the text is built once per sample size
+        cached = self._schema_text_cache.get(sample_rows)
+        if cached is not None:
+            return cached
         # build CREATE TABLE-ish schema description
         with self.lock:
             info = self.conn.execute(f'PRAGMA table_info("{self.table_name}")').fetchall()
@@ -81,7 +159,9 @@ class SimpleSQLite:
             for r in sample:
                 as_dict = {k: r[k] for k in r.keys()}
                 lines.append(str(as_dict))
-        return "\n".join(lines)
+        text = "\n".join(lines)
+        self._schema_text_cache[sample_rows] = text
+        return text
 
 def load_csv(path: str) -> List[Dict[str, Any]]:
     with open(path, "r", encoding="utf-8") as f:
@@ -100,14 +180,59 @@ def load_xlsx(path: str) -> List[Dict[str, Any]]:
         out.append({h: v for h, v in zip(headers, r)})
     return out
 
-def build_engine_from_file(path: str, table_name: str) -> SimpleSQLite:
+def load_xlsx_frame(path: str) -> "pd.DataFrame":
+    # calamine (Rust) parses the workbook natively; openpyxl is the pure-Python fallback
+    try:
+        return pd.read_excel(path, engine="calamine", dtype_backend="numpy_nullable")
+    except (ImportError, ValueError):
+        return pd.read_excel(path, engine="openpyxl", dtype_backend="numpy_nullable")
+
+def _snapshot_dir() -> str:
+    # per-user cache dir (not the shared temp dir): only this user can plant or swap snapshots
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base, "sql-spw-bot")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+def _snapshot_prefix(path: str, table_name: str) -> str:
+    # the pandas and legacy loaders declare different column types, so each gets its own snapshot
+    loader = "pandas" if pd is not None else "legacy"
+    key = f"{SNAPSHOT_VERSION}:{loader}:{os.path.abspath(path)}:{table_name}"
+    return os.path.join(_snapshot_dir(), f"sqlchat-{hashlib.sha1(key.encode()).hexdigest()}")
+
+def build_engine_from_file(path: str, table_name: str, force: bool = False) -> SimpleSQLite:
+    """Load path into a table; force=True ignores (and rewrites) any existing snapshot."""
     _, ext = os.path.splitext(path.lower())
-    if ext == ".csv":
-        rows = load_csv(path)
-    elif ext in (".xlsx", ".xlsm", ".xltx", ".xltm"):
-        rows = load_xlsx(path)
-    else:
+    if ext not in (".csv", ".xlsx", ".xlsm", ".xltx", ".xltm"):
         raise ValueError("Unsupported file type; use .csv or .xlsx")
+    # snapshots are keyed by (loader, path, table, mtime) so any process can skip the load
+    mtime_ns = os.stat(path).st_mtime_ns
+    try:
+        prefix = _snapshot_prefix(path, table_name)
+    except OSError:
+        prefix = None  # no usable cache dir: load without snapshots
+    snapshot_path = f"{prefix}-{mtime_ns}.db" if prefix else None
+    if snapshot_path and not force and os.path.exists(snapshot_path):
+        return SimpleSQLite(table_name=table_name, snapshot_path=snapshot_path)
+
     engine = SimpleSQLite(table_name=table_name)
-    engine.load_rows(rows)
+    if pd is not None:
+        # numpy_nullable keeps integer columns with blanks as INTEGER (+ NULL) rather than REAL
+        df = pd.read_csv(path, encoding="utf-8", dtype_backend="numpy_nullable") if ext == ".csv" else load_xlsx_frame(path)
+        engine.load_dataframe(df)
+    else:
+        rows = load_csv(path) if ext == ".csv" else load_xlsx(path)
+        engine.load_rows(rows)
+
+    if not snapshot_path:
+        return engine
+    for stale in glob.glob(f"{prefix}-*.db"):
+        try:
+            os.remove(stale)
+        except OSError:
+            pass  # still open elsewhere (e.g. a cached engine on Windows); retried next build
+    try:
+        engine.save_snapshot(snapshot_path)
+    except (OSError, sqlite3.Error):
+        pass  # snapshot is an optimization; the in-memory engine is already usable
     return engine
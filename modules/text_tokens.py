@@ -0,0 +1,9 @@
+import re
+from functools import lru_cache
+
+_TOK_RE = re.compile(r"[a-zA-Z0-9]+")
+
+@lru_cache(maxsize=512)
+def tokenize(s: str) -> frozenset:
+    """Lowercase alphanumeric word tokens; the one tokenizer for snippet/query similarity."""
+    return frozenset(_TOK_RE.findall(s.lower()))
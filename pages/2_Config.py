@@ -1,44 +1,51 @@
 import os
 import streamlit as st
 import yaml
-from modules.config_manager import load_config, save_config, AppConfig, AIConfig, DataConfig, Snippet
-from modules import sql_engine
+from modules.config_manager import save_config, AppConfig, AIConfig, DataConfig, Snippet
+from modules.app_cache import cached_config, rebuild_engine
 
 st.set_page_config(page_title="Config • SQL Chat", page_icon="⚙️", layout="wide")
 st.title("⚙️ Config")
 
 if "app_config" not in st.session_state:
-    st.session_state.app_config = load_config()
+    st.session_state.app_config = cached_config()
 cfg: AppConfig = st.session_state.app_config
 
+# set by widget callbacks; "Save All" only rewrites config.yaml when something changed
+if "cfg_dirty" not in st.session_state:
+    st.session_state.cfg_dirty = False
+
+def _mark_dirty():
+    st.session_state.cfg_dirty = True
+
 st.subheader("AI Settings")
 c1, c2, c3 = st.columns([1,1,1])
 with c1:
-    provider = st.selectbox("Provider", ["openai"], index=0)
+    provider = st.selectbox("Provider", ["openai"], index=0, on_change=_mark_dirty)
 with c2:
-    model = st.text_input("Model", value=cfg.ai.model, help="e.g., gpt-4o-mini")
+    model = st.text_input("Model", value=cfg.ai.model, help="e.g., gpt-4o-mini", on_change=_mark_dirty)
 with c3:
-    temperature = st.slider("Temperature", 0.0, 1.0, value=float(cfg.ai.temperature), step=0.1)
+    temperature = st.slider("Temperature", 0.0, 1.0, value=float(cfg.ai.temperature), step=0.1, on_change=_mark_dirty)
 
-offline = st.toggle("Offline Demo Mode (no API calls)", value=cfg.ai.offline_demo_mode, help="Use a simple rule-based SQL generator and answerer.")
+offline = st.toggle("Offline Demo Mode (no API calls)", value=cfg.ai.offline_demo_mode, help="Use a simple rule-based SQL generator and answerer.", on_change=_mark_dirty)
 
-sys_prompt = st.text_area("System Prompt (Answering)", value=cfg.ai.system_prompt, height=140)
-sql_prompt = st.text_area("SQL Synthesizer Prompt", value=cfg.ai.sql_synth_prompt, height=160)
+sys_prompt = st.text_area("System Prompt (Answering)", value=cfg.ai.system_prompt, height=140, on_change=_mark_dirty)
+sql_prompt = st.text_area("SQL Synthesizer Prompt", value=cfg.ai.sql_synth_prompt, height=160, on_change=_mark_dirty)
 
 st.divider()
 st.subheader("Data Settings")
 d1, d2 = st.columns([2,1])
 with d1:
-    file_path = st.text_input("Data file path (.csv or .xlsx)", value=cfg.data.file_path)
+    file_path = st.text_input("Data file path (.csv or .xlsx)", value=cfg.data.file_path, on_change=_mark_dirty)
 with d2:
-    table_name = st.text_input("Table name", value=cfg.data.table_name)
+    table_name = st.text_input("Table name", value=cfg.data.table_name, on_change=_mark_dirty)
 
-details = st.text_area("Additional details (for the model)", value=cfg.data.additional_details, height=130)
+details = st.text_area("Additional details (for the model)", value=cfg.data.additional_details, height=130, on_change=_mark_dirty)
 
-build = st.button("Rebuild In-Memory Table")
+build = st.button("Rebuild Table from File", help="Reload the data file, bypassing cached engines and snapshots.")
 if build:
     try:
-        eng = sql_engine.build_engine_from_file(file_path, table_name)
+        eng = rebuild_engine(file_path, table_name)
         st.session_state.engine = eng
         st.session_state.engine_src = (file_path, table_name)
         st.success("Rebuilt table successfully.")
@@ -65,8 +72,8 @@ snips = st.session_state.snips  # alias for brevity
 delete_indices = []
 for i, s in enumerate(snips):
     with st.container(border=True):
-        n = st.text_input(f"Name #{i+1}", value=s.name, key=f"sn-name-{i}")
-        q = st.text_area(f"SQL #{i+1}", value=s.sql, key=f"sn-sql-{i}", height=80)
+        n = st.text_input(f"Name #{i+1}", value=s.name, key=f"sn-name-{i}", on_change=_mark_dirty)
+        q = st.text_area(f"SQL #{i+1}", value=s.sql, key=f"sn-sql-{i}", height=80, on_change=_mark_dirty)
         if st.button(f"Delete #{i+1}", key=f"sn-del-{i}"):
             delete_indices.append(i)
         else:
@@ -76,6 +83,7 @@ for i, s in enumerate(snips):
 # apply deletions after the loop to avoid index shifts
 for idx in sorted(delete_indices, reverse=True):
     snips.pop(idx)
+    st.session_state.cfg_dirty = True
     # also clean up any orphaned widget state for neatness
     st.session_state.pop(f"sn-name-{idx}", None)
     st.session_state.pop(f"sn-sql-{idx}", None)
@@ -88,6 +96,7 @@ with st.container(border=True):
     if st.button("Add snippet"):
         if newn and news:
             snips.append(Snippet(name=newn, sql=news))
+            st.session_state.cfg_dirty = True
             # clear inputs so the user sees that it was added
             st.session_state["new-sn-n"] = ""
             st.session_state["new-sn-s"] = ""
@@ -104,7 +113,10 @@ if api_key:
     st.success("OPENAI_API_KEY set for this process.")
 
 st.divider()
-if st.button("Save All"):
+save = st.button("Save All")
+if save and not st.session_state.cfg_dirty:
+    st.info("No changes to save.")
+elif save:
     cfg.ai.provider = provider
     cfg.ai.model = model
     cfg.ai.temperature = float(temperature)
@@ -118,5 +130,6 @@ if st.button("Save All"):
     # persist from working copy
     cfg.snippets = st.session_state.snips
     save_config(cfg)
+    st.session_state.cfg_dirty = False
     st.success("Saved config.yaml")
 